@@ -8,35 +8,83 @@ import aiofiles
 from googletrans import Translator  # pip install googletrans==4.0.0rc1
 from tqdm import tqdm
 
+from glossary import Glossary
+from planner import PlanMemory, PlanTranslator, plan, text_kind
 from print_neatly import print_neatly
-
-logging.basicConfig(
-    level=logging.WARNING,
-    filename="app.log",
-    filemode="w",
-    format="%(asctime)s %(name)s - %(levelname)s - %(message)s",
+from scheduler import MAP_RE, PriorityTranslator, prioritize, run_by_priority
+from sharding import (
+    LocalTranslator,
+    add_shard_arguments,
+    setup_run,
+    shard_key,
+    shard_run,
 )
+from translation_memory import save_memory
+from watcher import watch_folder, write_json_atomic
 
 logger = logging.getLogger(__name__)
 
 
+async def translate_with_glossary(
+    tr, text, src, dst, glossary=None, memory=None
+):
+    """
+    Translate text, replacing the glossary terms with their fixed translations.
+    The translation memory is keyed on the text with the placeholders, so a glossary change
+    applies to sentences already in memory. If the translator loses a placeholder,
+    text is translated again without the glossary, so that no name disappears from the dialog.
+    """
+
+    async def request(target):
+        return (await tr.translate(target, src=src, dest=dst)).text
+
+    async def translate_target(target):
+        if memory is None:
+            return await request(target)
+        return await memory.translate(target, request)
+
+    if glossary is None:
+        return await translate_target(text)
+    target, terms = glossary.protect(text)
+    # both target and its fallback text must be translated by the shard of text
+    token = shard_key.set(text)
+    try:
+        restored = glossary.restore(await translate_target(target), terms)
+        if restored is None:
+            logger.warning(
+                f"Glossary placeholders lost, translated without glossary: {text}"
+            )
+            return await translate_target(text)
+        return restored
+    finally:
+        shard_key.reset(token)
+
+
 async def translate(
-    file_path, tr, src="it", dst="en", verbose=False, max_retries=5
+    file_path,
+    tr,
+    src="it",
+    dst="en",
+    verbose=False,
+    max_retries=5,
+    glossary=None,
+    memory=None,
 ):
 
     async def translate_sentence(text):
         target = text
-        translation = (await tr.translate(target, src=src, dest=dst)).text
+        translation = await translate_with_glossary(
+            tr, text, src, dst, glossary, memory
+        )
         if (
             target[0].isalpha()
             and translation[0].isalpha
             and not target[0].isupper()
         ):
             translation = translation[0].lower() + translation[1:]
-        text = translation
         if verbose:
             logger.info(f"{target} -> {translation}")
-        return text
+        return translation
 
     async def try_translate_sentence(text):
         try:
@@ -55,6 +103,7 @@ async def translate(
         async with translate_lock:
             # Plain text (ex: ["plain text"])
             if page_list["code"] == 401:
+                text_kind.set("401 plain text")
                 # null or empty string check
                 if not page_list["parameters"][0]:
                     return
@@ -72,6 +121,7 @@ async def translate(
 
             # Choices (ex: [["yes", "no"], 1, 0, 2, 0])
             elif page_list["code"] == 102:
+                text_kind.set("102 choices")
                 # null or empty list check
                 if not page_list["parameters"][0]:
                     return
@@ -92,6 +142,7 @@ async def translate(
 
             # Choices (answer) (ex: [0, "yes"])
             elif page_list["code"] == 402:
+                text_kind.set("402 choice answer")
                 # invalid length null or empty string check
                 if (
                     len(page_list["parameters"]) != 2
@@ -132,19 +183,28 @@ async def translate(
 
 
 async def translate_neatly(
-    file_path, tr, src="it", dst="en", verbose=False, max_len=40, max_retries=5
+    file_path,
+    tr,
+    src="it",
+    dst="en",
+    verbose=False,
+    max_len=40,
+    max_retries=5,
+    glossary=None,
+    memory=None,
 ):
     async def translate_sentence(text):
         target = text
-        translation = (await tr.translate(target, src=src, dest=dst)).text
+        translation = await translate_with_glossary(
+            tr, text, src, dst, glossary, memory
+        )
         if (
             target[0].isalpha()
             and translation[0].isalpha
             and not target[0].isupper()
         ):
             translation = translation[0].lower() + translation[1:]
-        text = translation
-        return text
+        return translation
 
     async def try_translate_sentence(text):
         try:
@@ -162,6 +222,7 @@ async def translate_neatly(
         nonlocal translations, code_401_text, was_401
         async with translate_neatly_lock:
             if was_401 and page_list["code"] != 401:
+                text_kind.set("401 plain text")
                 text = " ".join(code_401_text)
                 if not text:
                     return
@@ -196,6 +257,7 @@ async def translate_neatly(
                 code_401_text = []
             # 102 Choices (dont nestly translate) (ex: [["yes", "no"], 1, 0, 2, 0])
             if page_list["code"] == 102:
+                text_kind.set("102 choices")
                 # null or empty list check
                 if not page_list["parameters"][0]:
                     return
@@ -219,6 +281,7 @@ async def translate_neatly(
 
             # 402 Choices (answer) (dont nestly translate) (ex: [0, "yes"])
             elif page_list["code"] == 402:
+                text_kind.set("402 choice answer")
                 # invalid length null or empty string check
                 if (
                     len(page_list["parameters"]) != 2
@@ -269,20 +332,29 @@ async def translate_neatly(
 
 
 async def translate_neatly_common_events(
-    file_path, tr, src="it", dst="en", verbose=False, max_len=55, max_retries=5
+    file_path,
+    tr,
+    src="it",
+    dst="en",
+    verbose=False,
+    max_len=55,
+    max_retries=5,
+    glossary=None,
+    memory=None,
 ):
 
     async def translate_sentence(text):
         target = text
-        translation = (await tr.translate(target, src=src, dest=dst)).text
+        translation = await translate_with_glossary(
+            tr, text, src, dst, glossary, memory
+        )
         if (
             target[0].isalpha()
             and translation[0].isalpha
             and not target[0].isupper()
         ):
             translation = translation[0].lower() + translation[1:]
-        text = translation
-        return text
+        return translation
 
     async def translate_list(event_list, event_list_i: int, d):
         nonlocal was_401, code_401_text, translations
@@ -290,6 +362,7 @@ async def translate_neatly_common_events(
             if "code" not in event_list.keys():
                 return
             if was_401 and event_list["code"] != 401:
+                text_kind.set("401 plain text")
                 text = " ".join(code_401_text)
                 if not text:
                     return
@@ -349,57 +422,125 @@ async def translate_neatly_common_events(
 
 
 async def main():
-    async def translate_file(file: str, pbar: tqdm):
+    async def translate_file(file: str, pbar: tqdm = None, force=False):
         nonlocal translations
         file_path = os.path.join(args.input_folder, file)
-        if os.path.isfile(os.path.join(dest_folder, file)):
+        if not force and os.path.isfile(os.path.join(dest_folder, file)):
             logger.info(
                 f"skipped file {file_path} because it has already been translated"
             )
             return
+        if not MAP_RE.fullmatch(file) and not file.startswith("CommonEvents"):
+            logger.info(f"skipped file {file_path} because it has no dialogs")
+            if pbar is not None:
+                pbar.update(1)
+            return
         if file.endswith(".json"):
             logger.info(f"translating file: {file_path}")
-            if file.startswith("Map"):
+            if MAP_RE.fullmatch(file):
                 if args.print_neatly:
                     new_data, t = await translate_neatly(
                         file_path,
-                        tr=Translator(),
+                        tr=tr,
                         max_len=args.max_len,
                         src=args.source_lang,
                         dst=args.dest_lang,
                         verbose=args.verbose,
                         max_retries=args.max_retries,
+                        glossary=glossary,
+                        memory=memory,
                     )
                 else:
                     new_data, t = await translate(
                         file_path,
-                        tr=Translator(),
+                        tr=tr,
                         src=args.source_lang,
                         dst=args.dest_lang,
                         verbose=args.verbose,
                         max_retries=args.max_retries,
+                        glossary=glossary,
+                        memory=memory,
                     )
             elif file.startswith("CommonEvents"):
                 new_data, t = await translate_neatly_common_events(
                     file_path,
-                    tr=Translator(),
+                    tr=tr,
                     max_len=args.max_len,
                     src=args.source_lang,
                     dst=args.dest_lang,
                     verbose=args.verbose,
                     max_retries=args.max_retries,
+                    glossary=glossary,
+                    memory=memory,
                 )
             async with lock:
                 translations += t
+            if args.plan or args.shard:
+                return
             new_file = os.path.join(dest_folder, file)
-            async with aiofiles.open(new_file, "w", encoding="utf-8") as f:
-                if not args.no_format:
-                    await f.write(
-                        json.dumps(new_data, indent=4, ensure_ascii=False)
-                    )
-                else:
-                    await f.write(json.dumps(new_data, ensure_ascii=False))
-        pbar.update(1)
+            await write_json_atomic(new_file, new_data, args.no_format)
+        if pbar is not None:
+            pbar.update(1)
+
+    async def retranslate_file(file: str):
+        # unchanged sentences are found in the translation memory, so only
+        # the edited commands of the file are sent to the translator
+        # the glossary watcher and the folder watcher may retranslate the same file
+        async with retranslate_lock:
+            before = len(memory)
+            await translate_file(file, force=True)
+            if args.translation_memory:
+                save_memory(args.translation_memory, memory)
+            print(f"{file}: {len(memory) - before} new sentences translated")
+
+    async def watch_glossary():
+        # objects_translator --watch keeps updating the glossary: reload it and
+        # retranslate the files, only the sentences with changed names are sent
+        nonlocal glossary
+
+        def glossary_mtime():
+            # the glossary may be moved or being replaced while watching
+            try:
+                return os.path.getmtime(args.glossary)
+            except OSError as e:
+                logger.warning(f"failed to read {args.glossary}: {e!r}")
+                return None
+
+        mtime = glossary_mtime()
+        while True:
+            await asyncio.sleep(args.watch_interval)
+            new_mtime = glossary_mtime()
+            if new_mtime is None or new_mtime == mtime:
+                continue
+            mtime = new_mtime
+            try:
+                glossary = Glossary.load(args.glossary)
+            except (OSError, ValueError) as e:
+                logger.warning(f"failed to reload {args.glossary}: {e!r}")
+                continue
+            print(f"reloaded glossary {args.glossary}")
+            # files may have been added or removed since the start
+            try:
+                files = list_input_files()
+            except OSError as e:
+                logger.warning(f"failed to list {args.input_folder}: {e!r}")
+                continue
+            for file in files:
+                if not file.endswith(".json"):
+                    continue
+                try:
+                    await retranslate_file(file)
+                except Exception as e:
+                    # like watch_folder, one broken file does not stop the watch
+                    logger.warning(f"failed to translate {file}: {e!r}")
+
+    def list_input_files():
+        # System.json gives the starting map, translated first
+        return prioritize(
+            os.listdir(args.input_folder),
+            args.priority_order,
+            args.system_file or os.path.join(args.input_folder, "System.json"),
+        )
 
     ap = argparse.ArgumentParser()
     ap.add_argument("-i", "--input_folder", type=str, default="dialogs")
@@ -412,18 +553,69 @@ async def main():
     )
     ap.add_argument("-ml", "--max_len", type=int, default=44)
     ap.add_argument("-mr", "--max_retries", type=int, default=10)
+    ap.add_argument("-g", "--glossary", type=str, default=None)
+    ap.add_argument("-tm", "--translation_memory", type=str, default=None)
+    ap.add_argument("-w", "--watch", action="store_true", default=False)
+    ap.add_argument("-wi", "--watch_interval", type=float, default=1.0)
+    ap.add_argument("-j", "--jobs", type=int, default=0)
+    ap.add_argument("-rq", "--max_requests", type=int, default=16)
+    ap.add_argument("-po", "--priority_order", nargs="*", default=[])
+    ap.add_argument("-sf", "--system_file", type=str, default=None)
+    ap.add_argument("-p", "--plan", action="store_true", default=False)
+    ap.add_argument("-pr", "--plan_rate_limit", type=float, default=0)
+    ap.add_argument("-pl", "--plan_latency", type=float, default=0.5)
+    add_shard_arguments(ap)
     args = ap.parse_args()
+    memory = setup_run(ap, args)
     dest_folder = args.input_folder + "_" + args.dest_lang
+    if args.glossary and not os.path.isfile(args.glossary):
+        ap.error(f"glossary file not found: {args.glossary}")
+    glossary = Glossary.load(args.glossary) if args.glossary else None
+    input_files = list_input_files()
     translations = 0
     lock = asyncio.Lock()
-    input_files = os.listdir(args.input_folder)
-    if not os.path.exists(dest_folder):
+    retranslate_lock = asyncio.Lock()
+    if args.plan:
+        memory = PlanMemory(memory)
+        tr = PlanTranslator()
+        await plan(
+            translate_file,
+            memory,
+            input_files,
+            dest_folder,
+            args.jobs,
+            args.plan_rate_limit,
+            args.plan_latency,
+            sequential_files=True,
+            max_requests=args.max_requests,
+        )
+        return
+    tr = Translator() if args.translator == "google" else LocalTranslator()
+    if args.max_requests > 0:
+        # all the files are started, the requests of the first ones are sent first
+        tr = PriorityTranslator(tr, args.max_requests)
+    memory, tr = await shard_run(ap, args, memory, tr)
+    if not args.shard and not os.path.exists(dest_folder):
         os.makedirs(dest_folder)
-    with tqdm(total=len(input_files), desc="Overall") as pbar:
-        async with asyncio.TaskGroup() as tg:
-            for file in input_files:
-                tg.create_task(translate_file(file, pbar))
+    try:
+        with tqdm(total=len(input_files), desc="Overall") as pbar:
+            await run_by_priority(
+                input_files, lambda f: translate_file(f, pbar), args.jobs
+            )
+    finally:
+        if args.translation_memory:
+            save_memory(args.translation_memory, memory)
     logger.info(f"\ndone! translated in total {translations} dialog windows")
+    if args.watch:
+        print(f"watching {args.input_folder} for changes (ctrl+c to stop)")
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(
+                watch_folder(
+                    args.input_folder, retranslate_file, args.watch_interval
+                )
+            )
+            if args.glossary:
+                tg.create_task(watch_glossary())
 
 
 # usage: python dialogs_translator.py --print_neatly --source_lang it --dest_lang en
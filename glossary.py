@@ -0,0 +1,177 @@
+import json
+import os
+import re
+from collections import deque
+
+PLACEHOLDER = "[[{}]]"
+# the translator may add spaces inside the placeholder, so be lenient when restoring
+PLACEHOLDER_RE = re.compile(r"\[\s*\[\s*(\d+)\s*\]\s*\]")
+
+
+def separates_words(c):
+    """
+    True if c is a letter or digit of a script writing spaces between words (latin, greek,
+    cyrillic, arabic, ...). Chinese, japanese, korean and thai attach words to each other,
+    so a term followed by a particle (ex: アレックスは) must still match.
+    """
+    return c.isalnum() and ord(c) < 0x0E00
+
+
+class Glossary:
+    """
+    Fixed translations for names (actors, items, skills, ...) enforced in every sentence.
+    Terms are found with an Aho-Corasick automaton, so a sentence is scanned once
+    regardless of how many terms the glossary contains.
+    @param terms : dict mapping each source term to its translation
+    """
+
+    def __init__(self, terms):
+        self.terms = {k: v for k, v in terms.items() if k and v}
+        self._build()
+
+    def _build(self):
+        # goto[node] maps a character to the next node, out[node] holds the
+        # lengths of the terms ending at node (own term first, then the fail chain)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for term in self.terms:
+            node = 0
+            for c in term:
+                if c not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][c] = len(self._goto) - 1
+                node = self._goto[node][c]
+            self._out[node].append(len(term))
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(c, 0)
+                self._out[child] = (
+                    self._out[child] + self._out[self._fail[child]]
+                )
+
+    def find(self, text):
+        """
+        Return the (start, end) spans of the glossary terms in text.
+        Terms edged by letters of scripts separating words with spaces only match whole words,
+        and overlaps are resolved leftmost-longest.
+        """
+        matches = []
+        node = 0
+        for end, c in enumerate(text, 1):
+            while node and c not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(c, 0)
+            for length in self._out[node]:
+                start = end - length
+                if (
+                    start == 0
+                    or not separates_words(text[start])
+                    or not text[start - 1].isalnum()
+                ) and (
+                    end == len(text)
+                    or not separates_words(text[end - 1])
+                    or not text[end].isalnum()
+                ):
+                    matches.append((start, end))
+        matches.sort(key=lambda m: (m[0], -m[1]))
+        spans = []
+        last_end = 0
+        for start, end in matches:
+            if start >= last_end:
+                spans.append((start, end))
+                last_end = end
+        return spans
+
+    def protect(self, text):
+        """
+        Replace the glossary terms in text with placeholders the translator leaves untouched.
+        Returns the protected text and the translations to put back with restore.
+        """
+        protected = []
+        replacements = []
+        last_end = 0
+        for start, end in self.find(text):
+            protected.append(text[last_end:start])
+            protected.append(PLACEHOLDER.format(len(replacements)))
+            replacements.append(self.terms[text[start:end]])
+            last_end = end
+        protected.append(text[last_end:])
+        return "".join(protected), replacements
+
+    def restore(self, text, replacements):
+        """
+        Substitute the placeholders left by protect with the glossary translations.
+        Returns None if the translator lost or changed some placeholder.
+        """
+        restored = set()
+
+        def substitute(match):
+            i = int(match.group(1))
+            if i >= len(replacements):
+                return match.group(0)
+            restored.add(i)
+            return replacements[i]
+
+        text = PLACEHOLDER_RE.sub(substitute, text)
+        if len(restored) < len(replacements) or PLACEHOLDER_RE.search(text):
+            return None
+        return text
+
+    @classmethod
+    def load(cls, path, missing_ok=False):
+        """
+        Load the glossary json file at path.
+        @param missing_ok : if True, a missing file gives an empty glossary instead of an error
+        """
+        if missing_ok and not os.path.isfile(path):
+            return cls({})
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        # written through a temporary file, a translator in watch mode may be reading it
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(
+                json.dumps(
+                    self.terms, indent=4, ensure_ascii=False, sort_keys=True
+                )
+            )
+        os.replace(tmp_path, path)
+
+
+def update_glossary(path, terms):
+    """Merge terms into the glossary file at path, creating it if needed."""
+    glossary = Glossary(
+        {**Glossary.load(path, missing_ok=True).terms, **terms}
+    )
+    glossary.save(path)
+    return glossary
+
+
+def terms_from_objects(data, data_tr):
+    """
+    Collect the name translations of an objects file (Actors.json, Items.json, ...)
+    by pairing each entry of the original data with the same entry of its translation.
+    """
+    terms = {}
+    if not isinstance(data, list) or not isinstance(data_tr, list):
+        return terms
+    for d, d_tr in zip(data, data_tr):
+        if not isinstance(d, dict) or not isinstance(d_tr, dict):
+            continue
+        name, name_tr = d.get("name"), d_tr.get("name")
+        if isinstance(name, str) and isinstance(name_tr, str):
+            name, name_tr = name.strip(), name_tr.strip()
+            if name and name_tr:
+                terms[name] = name_tr
+    return terms
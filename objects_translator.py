@@ -8,35 +8,51 @@ import aiofiles
 from googletrans import Translator  # pip install googletrans==4.0.0rc1
 from tqdm import tqdm
 
+from glossary import terms_from_objects, update_glossary
+from planner import PlanMemory, PlanTranslator, plan, text_kind
 from print_neatly import print_neatly
-
-logging.basicConfig(
-    level=logging.WARNING,
-    filename="app.log",
-    filemode="w",
-    format="%(asctime)s %(name)s - %(levelname)s - %(message)s",
+from scheduler import PriorityTranslator, prioritize, run_by_priority
+from sharding import (
+    LocalTranslator,
+    add_shard_arguments,
+    setup_run,
+    shard_run,
 )
+from translation_memory import save_memory
+from watcher import watch_folder, write_json_atomic
 
 logger = logging.getLogger(__name__)
 
 
 async def translate(
-    file_path, tr, src="it", dst="en", verbose=False, max_retries=5, max_len=55
+    file_path,
+    tr,
+    src="it",
+    dst="en",
+    verbose=False,
+    max_retries=5,
+    max_len=55,
+    memory=None,
 ):
 
+    async def request(text):
+        return (await tr.translate(text, src=src, dest=dst)).text
+
     async def translate_sentence(text):
         target = text
-        translation = (await tr.translate(target, src=src, dest=dst)).text
+        if memory is None:
+            translation = await request(text)
+        else:
+            translation = await memory.translate(text, request)
         if (
             target[0].isalpha()
             and translation[0].isalpha
             and not target[0].isupper()
         ):
             translation = translation[0].lower() + translation[1:]
-        text = translation
         if verbose:
             logger.debug(f"{target} -> {translation}")
-        return text
+        return translation
 
     async def translate_and_check(
         text, remove_escape=True, neatly=False, keep_space=True
@@ -83,6 +99,7 @@ async def translate(
     ):
         async def translate_dict(d, dict_or_list):
             nonlocal translations
+            text_kind.set(d)
             tr, success = await translate_and_check(
                 dict_or_list[d], remove_escape, neatly
             )
@@ -92,6 +109,7 @@ async def translate(
 
         async def translate_list(i: int, dict_or_list):
             nonlocal translations
+            text_kind.set("array")
             tr, success = await translate_and_check(
                 dict_or_list[i], remove_escape, neatly
             )
@@ -140,7 +158,8 @@ async def translate(
 
     async def translate_non_key_based(d):
         nonlocal translations, i
-        if d is None:
+        # entries are dicts, anything else (ex: System.json) is left as is
+        if not isinstance(d, dict):
             return
         async with translate_lock:
             logger.info("{file_path}: {i + 1}/{num_ids}")
@@ -148,6 +167,7 @@ async def translate(
         if "name" in d.keys():
             if d["name"] == "":
                 return
+            text_kind.set("name")
             name_tr, success = await translate_and_check(
                 d["name"], remove_escape=True, neatly=False
             )
@@ -157,6 +177,7 @@ async def translate(
         if "description" in d.keys():
             if d["description"] == "":
                 return
+            text_kind.set("description")
             desc_tr, success = await translate_and_check(
                 d["description"], remove_escape=True, neatly=True
             )
@@ -166,6 +187,7 @@ async def translate(
         if "profile" in d.keys():
             if d["profile"] == "":
                 return
+            text_kind.set("profile")
             prf_tr, success = await translate_and_check(
                 d["profile"], remove_escape=True, neatly=True
             )
@@ -175,6 +197,7 @@ async def translate(
         for m in range(1, 5):
             message = "message" + str(m)
             if message in d.keys() and len(d[message]) > 0:
+                text_kind.set("message")
                 message_tr, success = await translate_and_check(
                     d[message], remove_escape=False, neatly=False
                 )
@@ -214,11 +237,29 @@ async def translate(
     return data, translations
 
 
+def build_glossary(input_folder, dest_folder, glossary_path):
+    # read back the translated files, so names fixed by hand in dest_folder are kept
+    terms = {}
+    for file in sorted(os.listdir(input_folder)):
+        new_file = os.path.join(dest_folder, file)
+        if not file.endswith(".json") or not os.path.isfile(new_file):
+            continue
+        with open(
+            os.path.join(input_folder, file), "r", encoding="utf-8-sig"
+        ) as f:
+            data = json.load(f)
+        with open(new_file, "r", encoding="utf-8-sig") as f:
+            data_tr = json.load(f)
+        terms.update(terms_from_objects(data, data_tr))
+    glossary = update_glossary(glossary_path, terms)
+    logger.info(f"glossary {glossary_path} has {len(glossary.terms)} terms")
+
+
 async def main():
-    async def translate_file(file, pbar: tqdm):
+    async def translate_file(file, pbar: tqdm = None, force=False):
         nonlocal translations
         file_path = os.path.join(args.input_folder, file)
-        if os.path.isfile(os.path.join(dest_folder, file)):
+        if not force and os.path.isfile(os.path.join(dest_folder, file)):
             logger.info(
                 f"skipped file {file_path} because it has already been translated"
             )
@@ -227,24 +268,33 @@ async def main():
             logger.info(f"translating file: {file_path}")
             new_data, t = await translate(
                 file_path,
-                tr=Translator(),
+                tr=tr,
                 max_len=args.max_len,
                 src=args.source_lang,
                 dst=args.dest_lang,
                 verbose=args.verbose,
                 max_retries=args.max_retries,
+                memory=memory,
             )
             async with translate_file_lock:
                 translations += t
+            if args.plan or args.shard:
+                return
             new_file = os.path.join(dest_folder, file)
-            async with aiofiles.open(new_file, "w", encoding="utf-8") as f:
-                if not args.no_format:
-                    await f.write(
-                        json.dumps(new_data, indent=4, ensure_ascii=False)
-                    )
-                else:
-                    await f.write(json.dumps(new_data, ensure_ascii=False))
-        pbar.update(1)
+            await write_json_atomic(new_file, new_data, args.no_format)
+        if pbar is not None:
+            pbar.update(1)
+
+    async def retranslate_file(file):
+        # unchanged strings are found in the translation memory, so only
+        # the edited entries of the file are sent to the translator
+        before = len(memory)
+        await translate_file(file, force=True)
+        if args.translation_memory:
+            save_memory(args.translation_memory, memory)
+        if args.glossary:
+            build_glossary(args.input_folder, dest_folder, args.glossary)
+        print(f"{file}: {len(memory) - before} new strings translated")
 
     ap = argparse.ArgumentParser()
     ap.add_argument("-i", "--input_folder", type=str, default="objects")
@@ -254,18 +304,67 @@ async def main():
     ap.add_argument("-nf", "--no_format", action="store_true", default=False)
     ap.add_argument("-ml", "--max_len", type=int, default=55)
     ap.add_argument("-mr", "--max_retries", type=int, default=10)
+    ap.add_argument("-g", "--glossary", type=str, default=None)
+    ap.add_argument("-tm", "--translation_memory", type=str, default=None)
+    ap.add_argument("-w", "--watch", action="store_true", default=False)
+    ap.add_argument("-wi", "--watch_interval", type=float, default=1.0)
+    ap.add_argument("-j", "--jobs", type=int, default=0)
+    ap.add_argument("-rq", "--max_requests", type=int, default=16)
+    ap.add_argument("-po", "--priority_order", nargs="*", default=[])
+    ap.add_argument("-sf", "--system_file", type=str, default=None)
+    ap.add_argument("-p", "--plan", action="store_true", default=False)
+    ap.add_argument("-pr", "--plan_rate_limit", type=float, default=0)
+    ap.add_argument("-pl", "--plan_latency", type=float, default=0.5)
+    add_shard_arguments(ap)
     args = ap.parse_args()
+    memory = setup_run(ap, args)
     dest_folder = args.input_folder + "_" + args.dest_lang
+    # System.json gives the starting map, translated first
+    input_files = prioritize(
+        os.listdir(args.input_folder),
+        args.priority_order,
+        args.system_file or os.path.join(args.input_folder, "System.json"),
+    )
     translations = 0
     translate_file_lock = asyncio.Lock()
-    if not os.path.exists(dest_folder):
+    if args.plan:
+        memory = PlanMemory(memory)
+        tr = PlanTranslator()
+        await plan(
+            translate_file,
+            memory,
+            input_files,
+            dest_folder,
+            args.jobs,
+            args.plan_rate_limit,
+            args.plan_latency,
+            sequential_files=False,
+            max_requests=args.max_requests,
+        )
+        return
+    tr = Translator() if args.translator == "google" else LocalTranslator()
+    if args.max_requests > 0:
+        # all the files are started, the requests of the first ones are sent first
+        tr = PriorityTranslator(tr, args.max_requests)
+    memory, tr = await shard_run(ap, args, memory, tr)
+    if not args.shard and not os.path.exists(dest_folder):
         os.makedirs(dest_folder)
-    input_files = os.listdir(args.input_folder)
-    with tqdm(total=len(input_files), desc="Overall") as pbar:
-        async with asyncio.TaskGroup() as tg:
-            for file in input_files:
-                tg.create_task(translate_file(file, pbar))
+    try:
+        with tqdm(total=len(input_files), desc="Overall") as pbar:
+            await run_by_priority(
+                input_files, lambda f: translate_file(f, pbar), args.jobs
+            )
+    finally:
+        if args.translation_memory:
+            save_memory(args.translation_memory, memory)
     logger.info(f"\ndone! translated in total {translations} strings")
+    if args.glossary and not args.shard:
+        build_glossary(args.input_folder, dest_folder, args.glossary)
+    if args.watch:
+        print(f"watching {args.input_folder} for changes (ctrl+c to stop)")
+        await watch_folder(
+            args.input_folder, retranslate_file, args.watch_interval
+        )
 
 
 # usage: python objects_translator.py --source_lang it --dest_lang en
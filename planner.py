@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+import heapq
+import os
+import types
+from collections import Counter, defaultdict
+
+from translation_memory import TranslationMemory
+
+# set by the translators before translating a string, so the plan can be split by kind
+text_kind = contextvars.ContextVar("text_kind", default="other")
+
+
+class PlanTranslator:
+    """Stand-in for googletrans.Translator that makes no network call and returns the text as is."""
+
+    async def translate(self, text, src="it", dest="en"):
+        return types.SimpleNamespace(text=text)
+
+
+class PlanMemory(TranslationMemory):
+    """
+    Translation memory recording every lookup made by the translators.
+    A lookup that misses is a request the real run would send.
+    @param memory : translation memory loaded from disk, its entries count as cache hits
+    """
+
+    def __init__(self, memory=None):
+        super().__init__(memory or {}, getattr(memory, "info", None))
+        self.stored = set(self)
+        self.file = None
+        # (file, kind, text, hit) for every string the translators look up
+        self.lookups = []
+        # requests of each task of each file, a task awaits its requests one after the other
+        self.task_requests = defaultdict(Counter)
+
+    def __contains__(self, text):
+        hit = super().__contains__(text)
+        self.lookups.append((self.file, text_kind.get(), text, hit))
+        if not hit:
+            self.task_requests[self.file][asyncio.current_task()] += 1
+        return hit
+
+
+def summarize(lookups, stored):
+    """Count strings, characters, cache hits and requests of a list of lookups."""
+    summary = {
+        "strings": len(lookups),
+        "unique": len({text for _, _, text, _ in lookups}),
+        "chars": sum(len(text) for _, _, text, _ in lookups),
+        "memory_hits": 0,
+        "repeated_hits": 0,
+        "requests": 0,
+        "request_chars": 0,
+    }
+    for _, _, text, hit in lookups:
+        if not hit:
+            summary["requests"] += 1
+            summary["request_chars"] += len(text)
+        elif text in stored:
+            summary["memory_hits"] += 1
+        else:
+            summary["repeated_hits"] += 1
+    return summary
+
+
+def estimate_time(
+    file_requests, file_chains, jobs, rate_limit, latency, max_requests=0
+):
+    """
+    Estimate the wall time in seconds of a run.
+    @param file_requests : requests of each file, in the order the files are started
+    @param file_chains : longest run of requests of each file sent one after the other,
+        the other requests of the file are sent at the same time
+    @param jobs : files translated at the same time, all of them if 0
+    @param rate_limit : maximum requests per second, 0 if unlimited
+    @param latency : seconds taken by a single request
+    @param max_requests : requests sent at the same time, unlimited if 0
+    """
+    durations = [chain * latency for chain in file_chains]
+    if jobs <= 0 or jobs > len(durations):
+        jobs = len(durations)
+    # like run_by_priority, each file starts on the first job to be free
+    jobs_end = [0.0] * max(jobs, 1)
+    for duration in durations:
+        heapq.heappush(jobs_end, heapq.heappop(jobs_end) + duration)
+    estimate = max(jobs_end)
+    if max_requests > 0:
+        estimate = max(estimate, sum(file_requests) * latency / max_requests)
+    if rate_limit > 0:
+        estimate = max(estimate, sum(file_requests) / rate_limit)
+    return estimate
+
+
+def format_time(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s"
+
+
+def print_plan(
+    memory,
+    jobs,
+    rate_limit=0,
+    latency=0.5,
+    sequential_files=True,
+    skipped=(),
+    max_requests=0,
+):
+    """
+    Print the strings, characters, cache hits, requests and estimated time of a planned run.
+    @param memory : PlanMemory the translators were run with, one file after the other
+    @param jobs : files translated at the same time, all of them if 0
+    @param sequential_files : True if the strings of a file are translated one after the other
+    @param skipped : files that would be skipped because already translated
+    @param max_requests : requests sent at the same time, unlimited if 0
+    """
+    by_file = defaultdict(list)
+    by_kind = defaultdict(list)
+    for lookup in memory.lookups:
+        by_file[lookup[0]].append(lookup)
+        by_kind[lookup[1]].append(lookup)
+    header = (
+        f"{'':<28}{'strings':>9}{'unique':>9}{'chars':>10}"
+        f"{'hits':>9}{'requests':>10}{'req chars':>11}"
+    )
+
+    def print_rows(groups):
+        print(header)
+        for name, lookups in sorted(groups.items(), key=lambda g: str(g[0])):
+            s = summarize(lookups, memory.stored)
+            hits = s["memory_hits"] + s["repeated_hits"]
+            print(
+                f"{str(name):<28}{s['strings']:>9}{s['unique']:>9}{s['chars']:>10}"
+                f"{hits:>9}{s['requests']:>10}{s['request_chars']:>11}"
+            )
+        print()
+
+    print_rows(by_file)
+    print_rows(by_kind)
+    total = summarize(memory.lookups, memory.stored)
+    # by_file keeps the order the files were planned in, the order of the real run
+    file_requests = [
+        summarize(lookups, memory.stored)["requests"]
+        for lookups in by_file.values()
+    ]
+    # the strings of an objects entry (name, description, messages...) are
+    # translated one after the other, the entries at the same time
+    file_chains = [
+        (
+            requests
+            if sequential_files
+            else max(memory.task_requests[file].values(), default=0)
+        )
+        for file, requests in zip(by_file, file_requests)
+    ]
+    estimate = estimate_time(
+        file_requests, file_chains, jobs, rate_limit, latency, max_requests
+    )
+    print(f"files to translate: {len(by_file)} (skipped: {len(skipped)})")
+    print(f"strings: {total['strings']} ({total['unique']} unique)")
+    print(f"characters: {total['chars']}")
+    print(
+        f"projected cache hits: {total['memory_hits']} from the translation memory,"
+        f" {total['repeated_hits']} repeated strings"
+    )
+    print(
+        f"requests: {total['requests']} ({total['request_chars']} characters)"
+    )
+    rate = f"{rate_limit} requests/s" if rate_limit > 0 else "no rate limit"
+    jobs = f"{jobs} jobs" if jobs > 0 else "all files at once"
+    requests = (
+        f"{max_requests} requests at a time"
+        if max_requests > 0
+        else "unlimited requests at a time"
+    )
+    print(
+        f"estimated time: {format_time(estimate)} "
+        f"({jobs}, {requests}, {rate}, {latency}s per request)"
+    )
+
+
+async def plan(
+    translate_file,
+    memory,
+    input_files,
+    dest_folder,
+    jobs,
+    rate_limit=0,
+    latency=0.5,
+    sequential_files=True,
+    max_requests=0,
+):
+    """
+    Plan a run and print its report.
+    translate_file must run offline with a PlanTranslator and memory, a PlanMemory
+    recording every string that the real run would look up and send to the translator.
+    @param input_files : files to translate, in the order they are started
+    """
+    skipped = [
+        f
+        for f in input_files
+        if f.endswith(".json") and os.path.isfile(os.path.join(dest_folder, f))
+    ]
+    # translated one after the other, so strings repeated in several files count once,
+    # as the translation memory shares the requests of the real run
+    for file in input_files:
+        memory.file = file
+        await translate_file(file)
+    print_plan(
+        memory,
+        jobs,
+        rate_limit,
+        latency,
+        sequential_files,
+        skipped,
+        max_requests,
+    )
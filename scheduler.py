@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import re
+
+# database files, from the most to the least visible in game
+DATABASE_ORDER = [
+    "System.json",
+    "Actors.json",
+    "Classes.json",
+    "Items.json",
+    "Weapons.json",
+    "Armors.json",
+    "Skills.json",
+    "States.json",
+    "Enemies.json",
+    "MapInfos.json",
+]
+
+MAP_RE = re.compile(r"Map(\d+)\.json")
+
+# position of the file being translated in the files given to run_by_priority
+file_rank = contextvars.ContextVar("file_rank", default=0)
+
+
+def start_map_file(system_file):
+    """Return the file of the map where the game starts, read from System.json."""
+    if not system_file or not os.path.isfile(system_file):
+        return None
+    try:
+        with open(system_file, "r", encoding="utf-8-sig") as f:
+            return f"Map{int(json.load(f)['startMapId']):03d}.json"
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+
+def file_priority(file, order=(), start_map=None):
+    """
+    Return the sort key of a file, files with a lower key are translated first.
+    Files in order come first, then CommonEvents.json and the starting map,
+    then the maps by id and finally the database files.
+    @param file : name of the file
+    @param order : names of the files to translate first, in this order
+    @param start_map : name of the file of the starting map
+    """
+    if file in order:
+        return (0, order.index(file), file)
+    if file.startswith("CommonEvents") or file == start_map:
+        return (1, 1 if file == start_map else 0, file)
+    match = MAP_RE.fullmatch(file)
+    if match:
+        return (2, int(match.group(1)), file)
+    if file in DATABASE_ORDER:
+        return (3, DATABASE_ORDER.index(file), file)
+    return (4, 0, file)
+
+
+def prioritize(files, order=(), system_file=None):
+    """
+    Sort files by priority.
+    @param order : names of the files to translate first, with or without .json
+    @param system_file : path of the System.json of the game, to find the starting map
+    """
+    order = [f if f.endswith(".json") else f + ".json" for f in order]
+    start_map = start_map_file(system_file)
+    return sorted(files, key=lambda f: file_priority(f, order, start_map))
+
+
+async def run_by_priority(files, worker, jobs):
+    """
+    Await worker(file) for every file, at most jobs at the same time (all of them if jobs is 0),
+    starting each file in the order of files.
+    """
+    if jobs <= 0:
+        jobs = len(files)
+    queue = asyncio.Queue()
+    for rank, file in enumerate(files):
+        queue.put_nowait((rank, file))
+
+    async def run_worker():
+        while not queue.empty():
+            rank, file = queue.get_nowait()
+            # inherited by the tasks of the file, so PriorityTranslator sends its requests by rank
+            file_rank.set(rank)
+            await worker(file)
+
+    async with asyncio.TaskGroup() as tg:
+        for _ in range(max(1, min(jobs, len(files)))):
+            tg.create_task(run_worker())
+
+
+class PriorityTranslator:
+    """
+    Wraps a translator so that at most max_requests requests are sent at the same time.
+    Waiting requests are sent by the rank of their file in run_by_priority, so with all
+    the files started at once the most important ones still get the translator first.
+    @param tr : translator to wrap (ex: googletrans.Translator)
+    @param max_requests : requests sent at the same time
+    """
+
+    def __init__(self, tr, max_requests):
+        self.tr = tr
+        self.free = max_requests
+        # heap of (rank, arrival, future) of the requests waiting for a free slot
+        self.waiting = []
+        self.arrivals = itertools.count()
+
+    async def translate(self, text, src="it", dest="en"):
+        await self.acquire(file_rank.get())
+        try:
+            return await self.tr.translate(text, src=src, dest=dest)
+        finally:
+            self.release()
+
+    async def acquire(self, rank):
+        if self.free > 0 and not self.waiting:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (rank, next(self.arrivals), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over right before the cancellation
+                self.release()
+            raise
+
+    def release(self):
+        # hand the slot over to the first waiting request still alive
+        while self.waiting:
+            _, _, future = heapq.heappop(self.waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.free += 1
@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import re
+import sys
+import tempfile
+import types
+
+from translation_memory import (
+    TranslationMemory,
+    load_memory,
+    memory_info,
+    save_memory,
+)
+
+# original sentence being translated, set by the translators when they look up a changed
+# text (ex: with glossary placeholders), so every lookup of a sentence goes to its shard
+shard_key = contextvars.ContextVar("shard_key", default=None)
+
+
+def shard_of(text, shards):
+    """Return the shard of a string, the same in every process and on every machine."""
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return int(digest, 16) % shards
+
+
+def parse_shard(value):
+    """Parse a shard given as index/shards (ex: 0/4), used as argparse type."""
+    try:
+        index, shards = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard {value}, expected index/shards (ex: 0/4)"
+        )
+    if not 0 <= index < shards:
+        raise argparse.ArgumentTypeError(
+            f"invalid shard {value}, index must be between 0 and {shards - 1}"
+        )
+    return index, shards
+
+
+def shard_memory_path(memory_path, index, shards):
+    return f"{os.path.splitext(memory_path)[0]}.{index}-of-{shards}.json"
+
+
+SHARD_MEMORY_RE = re.compile(r".+\.(\d+)-of-(\d+)\.json")
+
+
+def check_shard_memories(paths):
+    """
+    Raise ValueError unless paths are the translation memories of all the shards
+    of a run, named like shard_memory_path, each one given once.
+    """
+    if not paths:
+        raise ValueError("no shard translation memory to merge")
+    found = []
+    for path in paths:
+        if not os.path.isfile(path):
+            raise ValueError(f"shard translation memory not found: {path}")
+        match = SHARD_MEMORY_RE.fullmatch(os.path.basename(path))
+        if not match:
+            raise ValueError(
+                f"{path} is not named like a shard translation memory (ex: memory.0-of-4.json)"
+            )
+        found.append((int(match.group(2)), int(match.group(1))))
+    shards = {n for n, _ in found}
+    if len(shards) > 1:
+        raise ValueError(
+            f"shard translation memories of runs with {sorted(shards)} shards"
+        )
+    (shards,) = shards
+    indexes = sorted(i for _, i in found)
+    if indexes != list(range(shards)):
+        raise ValueError(
+            f"the translation memories of the shards 0 to {shards - 1} must be"
+            f" given once each, got the shards {indexes}"
+        )
+
+
+class ShardMemory(TranslationMemory):
+    """
+    Translation memory of a shard worker.
+    Strings of the other shards are reported as already translated (to themselves),
+    so only the strings of this shard are sent to the translator and stored.
+    A string belongs to the shard of shard_key if set, else to the shard of the string.
+    """
+
+    def __init__(self, memory, index, shards):
+        super().__init__(memory, memory.info)
+        self.index = index
+        self.shards = shards
+
+    def __contains__(self, text):
+        key = shard_key.get()
+        if key is None:
+            key = text
+        return shard_of(
+            key, self.shards
+        ) != self.index or super().__contains__(text)
+
+    def __missing__(self, text):
+        return text
+
+
+class LocalTranslator:
+    """Local stand-in for googletrans.Translator, tags the text with the destination language."""
+
+    async def translate(self, text, src="it", dest="en"):
+        return types.SimpleNamespace(text=f"[{dest}] {text}")
+
+
+class MemoryOnlyTranslator:
+    """Translator used when merging shards: every string must already be in the translation memory."""
+
+    async def translate(self, text, src="it", dest="en"):
+        raise KeyError(f"not in the translation memory: {text}")
+
+
+def merge_memories(paths, memory):
+    """
+    Merge the translation memories of the shards into memory.
+    Shards are merged in the order of their paths, so the result does not depend
+    on the order they were given nor on the order the workers finished.
+    Missing shards and shards made with another translator or other languages than memory
+    raise ValueError, the files would be built with untranslated strings.
+    """
+    check_shard_memories(paths)
+    merged = dict(memory)
+    for path in sorted(paths):
+        merged.update(load_memory(path, memory.info))
+    return TranslationMemory(sorted(merged.items()), memory.info)
+
+
+async def spawn_shards(shards, memory_path, memory):
+    """
+    Run the current command in shards local worker processes, one per shard,
+    and return the paths of their translation memories.
+    Every shard starts with the entries of memory, so they are not translated again:
+    an entry may be keyed on a changed text (ex: glossary placeholders) that does not
+    tell the shard of its sentence.
+    Existing shard memories are resumed, if they were made with the same translator and languages.
+    """
+    paths = [shard_memory_path(memory_path, i, shards) for i in range(shards)]
+    for path in paths:
+        if os.path.isfile(path):
+            # raises ValueError before starting any worker
+            load_memory(path, memory.info)
+            continue
+        save_memory(path, memory)
+    # options given last override the previous ones, so the workers get their own shard and memory
+    workers = [
+        await asyncio.create_subprocess_exec(
+            sys.executable,
+            *sys.argv,
+            "--shard",
+            f"{i}/{shards}",
+            "--translation_memory",
+            path,
+        )
+        for i, path in enumerate(paths)
+    ]
+    exit_codes = [await worker.wait() for worker in workers]
+    for i, exit_code in enumerate(exit_codes):
+        if exit_code != 0:
+            raise RuntimeError(
+                f"shard {i}/{shards} failed with exit code {exit_code}"
+            )
+    return paths
+
+
+def add_shard_arguments(ap):
+    """Add the translator and sharding options shared by the translators to the argparse parser ap."""
+    ap.add_argument(
+        "-t", "--translator", choices=["google", "local"], default="google"
+    )
+    ap.add_argument("-sh", "--shard", type=parse_shard, default=None)
+    ap.add_argument("-ss", "--spawn_shards", type=int, default=0)
+    ap.add_argument("-ms", "--merge_shards", nargs="*", default=[])
+
+
+def setup_run(ap, args):
+    """
+    Configure the log of the run, check its sharding options and return its translation memory.
+    Invalid options and a translation memory of another translator or other languages
+    exit through ap.error.
+    """
+    # each shard worker has its own log, they run at the same time as the parent
+    logging.basicConfig(
+        level=logging.WARNING,
+        filename=(
+            f"app.{args.shard[0]}-of-{args.shard[1]}.log"
+            if args.shard
+            else "app.log"
+        ),
+        filemode="w",
+        format="%(asctime)s %(name)s - %(levelname)s - %(message)s",
+    )
+    if args.shard and not args.translation_memory:
+        ap.error("--shard requires --translation_memory")
+    if args.watch and (args.shard or args.spawn_shards or args.merge_shards):
+        ap.error("--watch cannot be used with sharded runs")
+    try:
+        return load_memory(
+            args.translation_memory,
+            memory_info(args.translator, args.source_lang, args.dest_lang),
+        )
+    except ValueError as e:
+        ap.error(str(e))
+
+
+async def shard_run(ap, args, memory, tr):
+    """
+    Return the translation memory and the translator to translate the files with.
+    A shard worker only translates the strings of its shard. With --spawn_shards and
+    --merge_shards the strings are translated by the shards first, then the files are
+    built from their merged translation memories without any request.
+    """
+    if args.shard:
+        # worker: translate the strings of its shard into its translation memory
+        return ShardMemory(memory, *args.shard), tr
+    if not args.spawn_shards and not args.merge_shards:
+        return memory, tr
+    try:
+        if args.spawn_shards:
+            with tempfile.TemporaryDirectory() as tmp_folder:
+                # without --translation_memory, the shard memories are
+                # only kept until they are merged
+                shard_paths = await spawn_shards(
+                    args.spawn_shards,
+                    args.translation_memory
+                    or os.path.join(tmp_folder, "memory.json"),
+                    memory,
+                )
+                memory = merge_memories(shard_paths, memory)
+        else:
+            memory = merge_memories(args.merge_shards, memory)
+    except ValueError as e:
+        ap.error(str(e))
+    # every string has been translated by a shard, build the files offline
+    args.max_retries = 0
+    return memory, MemoryOnlyTranslator()
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import os
+
+
+class TranslationMemory(dict):
+    """
+    dict mapping each original sentence to its translation.
+    Sentences being translated are tracked too, so concurrent translations
+    of the same sentence share a single request.
+    @param translations : original sentences and their translations
+    @param info : translator, source_lang and dest_lang the translations were made with
+    """
+
+    def __init__(self, translations=(), info=None):
+        super().__init__(translations)
+        self.info = info or {}
+        self.pending = {}
+
+    async def translate(self, text, request):
+        """
+        Return the translation of text, awaiting request(text) only if text is
+        neither in memory nor already being translated.
+        """
+        if text in self:
+            return self[text]
+        if text in self.pending:
+            return await asyncio.shield(self.pending[text])
+        future = asyncio.get_running_loop().create_future()
+        self.pending[text] = future
+        try:
+            translation = await request(text)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved, there may be nobody waiting for it
+            future.exception()
+            raise
+        finally:
+            del self.pending[text]
+        self[text] = translation
+        future.set_result(translation)
+        return translation
+
+
+def memory_info(translator, source_lang, dest_lang):
+    return {
+        "translator": translator,
+        "source_lang": source_lang,
+        "dest_lang": dest_lang,
+    }
+
+
+def load_memory(path, info):
+    """
+    Load a translation memory, a json file with the info of the run that made it
+    and a dict mapping each original sentence to its translation.
+    Returns an empty memory if the file does not exist yet.
+    @param info : memory_info of the current run, a memory made with another
+        translator or other languages raises ValueError
+    """
+    if not path or not os.path.isfile(path):
+        return TranslationMemory(info=info)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or data.get("info") != info:
+        found = data.get("info") if isinstance(data, dict) else None
+        raise ValueError(
+            f"translation memory {path} was made with {found}, not {info}"
+        )
+    return TranslationMemory(data["translations"], info)
+
+
+def save_memory(path, memory):
+    """Write the translation memory to path, replacing the old file only once fully written."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    data = {"info": memory.info, "translations": dict(sorted(memory.items()))}
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, indent=4, ensure_ascii=False))
+    os.replace(tmp_path, path)
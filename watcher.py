@@ -0,0 +1,58 @@
+import asyncio
+import json
+import logging
+import os
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+
+def scan_folder(folder):
+    """Return the modification time of every json file in folder."""
+    mtimes = {}
+    with os.scandir(folder) as entries:
+        for e in entries:
+            try:
+                if e.is_file() and e.name.endswith(".json"):
+                    mtimes[e.name] = e.stat().st_mtime_ns
+            except FileNotFoundError:
+                # deleted while scanning
+                continue
+    return mtimes
+
+
+async def watch_folder(folder, on_change, interval=1.0):
+    """
+    Poll folder forever and await on_change(file) for every json file created or modified.
+    @param folder : folder to watch
+    @param on_change : coroutine function called with the name of the changed file
+    @param interval : seconds between two polls
+    """
+    mtimes = scan_folder(folder)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = scan_folder(folder)
+        except OSError as e:
+            logger.warning(f"failed to scan {folder}: {e!r}")
+            continue
+        changed = sorted(f for f, m in current.items() if mtimes.get(f) != m)
+        mtimes = current
+        for file in changed:
+            try:
+                await on_change(file)
+            except Exception as e:
+                # the editor may still be writing the file, it is retried on the next save
+                logger.warning(f"failed to translate {file}: {e!r}")
+
+
+async def write_json_atomic(path, data, no_format=False):
+    """Write data to path through a temporary file, so readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+        if not no_format:
+            await f.write(json.dumps(data, indent=4, ensure_ascii=False))
+        else:
+            await f.write(json.dumps(data, ensure_ascii=False))
+    os.replace(tmp_path, path)